@@ -1,19 +1,67 @@
 """JS8Call LXMF Bot implementation for message forwarding between JS8Call and LXMF networks."""
 
-import configparser
+import functools
 import json
 import logging
+import queue
+import re
+import selectors
+import socket
+import sqlite3
 import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from logging.handlers import RotatingFileHandler
-from socket import AF_INET, SOCK_STREAM, socket
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from lxmfy import IconAppearance, LXMFBot, pack_icon_appearance_field
 
+from .config import load_config
 from .storage.sqlite_storage import SQLiteStorage
 
+STATE_FLUSH_DELAY = 1.0
+STATE_FLUSH_MAX_DELAY = 10.0
+USER_KEY_PREFIX = "js8call_user_"
+LEGACY_USERS_KEY = "users"
+SEND_QUEUE_FACTOR = 4
+RECV_BUFFER_SIZE = 65536
+MAX_FRAME_LENGTH = 65536
+RECONNECT_BACKOFF_MIN = 1.0
+RECONNECT_BACKOFF_MAX = 60.0
+# What a storage backend raises for a failed write: SQLite and file errors,
+# and TypeError/ValueError from serializing the value.
+STORAGE_ERRORS = (sqlite3.Error, OSError, TypeError, ValueError)
+
+RECENT_MESSAGES_QUERY = """
+    SELECT sender, receiver, message, timestamp
+    FROM (
+        SELECT sender, receiver, message, timestamp FROM messages
+        UNION ALL
+        SELECT sender, groupname as receiver, message, timestamp FROM groups
+        UNION ALL
+        SELECT sender, groupname as receiver, message, timestamp FROM urgent
+    )
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+DAILY_USERS_QUERY = "SELECT user_count FROM stats WHERE date = ?"
+AVERAGE_USERS_QUERY = "SELECT AVG(user_count) FROM stats WHERE date >= ? AND date < ?"
+MESSAGE_COUNTS_QUERY = """
+    SELECT 'direct', COUNT(*) FROM messages
+    UNION ALL
+    SELECT 'group', COUNT(*) FROM groups
+    UNION ALL
+    SELECT 'urgent', COUNT(*) FROM urgent
+"""
+MESSAGE_COUNTS_RANGE_QUERY = """
+    SELECT 'direct', COUNT(*) FROM messages WHERE timestamp >= :start AND timestamp < :end
+    UNION ALL
+    SELECT 'group', COUNT(*) FROM groups WHERE timestamp >= :start AND timestamp < :end
+    UNION ALL
+    SELECT 'urgent', COUNT(*) FROM urgent WHERE timestamp >= :start AND timestamp < :end
+"""
+
 
 class JS8CallBot:
     """JS8Call LXMF Bot for message forwarding between JS8Call and LXMF networks."""
@@ -31,18 +79,16 @@ class JS8CallBot:
         self.node_operator = None
         self.blocked_words = []
 
-        self.cfg = configparser.ConfigParser()
-        self.cfg.read("config.ini")
+        self.config = load_config("config.ini")
 
         if name is None:
-            name = self.cfg.get("bot", "name", fallback="JS8Call-Bot")
+            name = self.config.name
 
         self.bot = LXMFBot(
             name=name,
-            announce=self.cfg.getint("bot", "announce_interval", fallback=360),
+            announce=self.config.announce_interval,
             announce_immediately=True,
-            admins=set(self.cfg.get("bot", "allowed_users", fallback="")
-                      .strip().split(",")),
+            admins=set(self.config.admins),
             hot_reloading=True,
             rate_limit=5,
             cooldown=10,
@@ -51,8 +97,8 @@ class JS8CallBot:
             command_prefix="/",
             permissions_enabled=True,
             first_message_enabled=True,
-            signature_verification_enabled=self.cfg.getboolean("bot", "signature_verification_enabled", fallback=False),
-            require_message_signatures=self.cfg.getboolean("bot", "require_message_signatures", fallback=False),
+            signature_verification_enabled=self.config.signature_verification_enabled,
+            require_message_signatures=self.config.require_message_signatures,
         )
 
         icon_data = IconAppearance(
@@ -60,10 +106,8 @@ class JS8CallBot:
         )
         self.icon_lxmf_field = pack_icon_appearance_field(icon_data)
 
-        self.db = SQLiteStorage(
-            self.cfg.get("js8call", "db_file", fallback="js8call.db"),
-        )
-        if self.cfg.get("bot", "store_users_in_db", fallback="no").lower() in ("yes", "true", "1"):
+        self.db = SQLiteStorage(self.config.db_file)
+        if self.config.store_users_in_db:
             self.bot.storage = self.db
 
         self.setup_logging()
@@ -82,80 +126,239 @@ class JS8CallBot:
             logging.StreamHandler(),
         ]
 
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
         for handler in handlers:
-            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
             handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+
+        log_queue = queue.SimpleQueue()
+        self.logger.handlers.clear()
+        self.logger.addHandler(QueueHandler(log_queue))
+        self.log_listener = QueueListener(
+            log_queue, *handlers, respect_handler_level=True,
+        )
+        self.log_listener.start()
 
     def setup_js8call(self):
         """Initialize JS8Call connection settings."""
-        self.js8call_server = (
-            self.cfg.get("js8call", "host", fallback="localhost"),
-            self.cfg.getint("js8call", "port", fallback=2442),
-        )
+        self.js8call_server = (self.config.host, self.config.port)
         self.js8call_socket = None
         self.js8call_connected = False
+        self._selector = selectors.DefaultSelector()
+        self._rx_buf = bytearray()
+        self._rx_chunk = memoryview(bytearray(RECV_BUFFER_SIZE))
+        self._reconnect_backoff = RECONNECT_BACKOFF_MIN
+
+        self.js8groups = list(self.config.js8groups)
+        self.js8urgent = list(self.config.js8urgent)
+        self._all_groups = frozenset(self.js8groups) | frozenset(self.js8urgent)
+
+        self._group_kind = {g: "urgent" for g in self.js8urgent}
+        self._group_kind.update({g: "group" for g in self.js8groups})
+        self._group_re = None
+        if self._group_kind:
+            prefixes = sorted(self._group_kind, key=len, reverse=True)
+            self._group_re = re.compile(
+                "^(?P<g>" + "|".join(map(re.escape, prefixes)) + ")",
+            )
 
-        self.js8groups = self.cfg.get("js8call", "js8groups", fallback="").split(",")
-        self.js8urgent = self.cfg.get("js8call", "js8urgent", fallback="").split(",")
-        self.js8groups = [group.strip() for group in self.js8groups]
-        self.js8urgent = [group.strip() for group in self.js8urgent]
+        self.blocked_words = list(self.config.blocked_words)
+        self._blocked_re = None
+        if self.blocked_words:
+            self._blocked_re = re.compile(
+                "|".join(map(re.escape, self.blocked_words)), re.IGNORECASE,
+            )
 
     def setup_state(self):
         """Initialize bot state and load users from storage."""
         self.distro_list = set()
         self.user_groups = defaultdict(set)
         self.muted_users = defaultdict(set)
+        self.group_subscribers = defaultdict(set)
+        self.group_muted = defaultdict(set)
         self.start_time = time.time()
+        self._welcome_msg = self._build_welcome_message()
+        self._state_lock = threading.RLock()
+        self._snapshot = (frozenset(), {})
+        self._dirty_users = set()
+        self._dirty_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flush_stop = threading.Event()
+        self._flush_deadline = 0.0
+        self._flush_latest = 0.0
         self.load_state_from_storage()
+        send_workers = min(32, max(4, len(self.distro_list)))
+        self.thread_pool = ThreadPoolExecutor(
+            max_workers=send_workers, thread_name_prefix="js8call-send",
+        )
+        self._send_batch_size = SEND_QUEUE_FACTOR * send_workers
+
+    def _build_welcome_message(self):
+        """Build the message sent to users when they join the distribution list."""
+        default_groups = self.config.default_groups
+        welcome_msg = "You have been added to the JS8Call message group"
+        if default_groups:
+            welcome_msg += (
+                f" and the following default groups: {', '.join(default_groups)}"
+            )
+        return welcome_msg + ". You will receive messages when they are available."
 
     def load_state_from_storage(self):
-        """Load users and their settings from storage."""
+        """Load users and their settings from storage.
+
+        Users are stored one key per user. A legacy single "users" blob is
+        loaded as well and migrated to per-user keys.
+        """
         try:
-            users_data = self.bot.storage.get("users", {})
-            if users_data:
+            storage = self.bot.storage
+            legacy_users = storage.get(LEGACY_USERS_KEY, {}) or {}
+            users_data = dict(legacy_users)
+            for key in storage.scan(USER_KEY_PREFIX):
+                user_data = storage.get(key)
+                if user_data is not None:
+                    users_data[key[len(USER_KEY_PREFIX):]] = user_data
+            with self._state_lock:
                 for user_hash, user_data in users_data.items():
                     self.distro_list.add(user_hash)
-                    self.user_groups[user_hash] = set(user_data.get("groups", []))
-                    self.muted_users[user_hash] = set(user_data.get("muted_groups", []))
+                    for group in user_data.get("groups", []):
+                        self._bind(user_hash, group)
+                    for group in user_data.get("muted_groups", []):
+                        self._mute(user_hash, group)
+                self._publish_snapshot()
+            if legacy_users:
+                self._migrate_legacy_users(users_data)
             self.logger.info("Loaded %d users from storage", len(self.distro_list))
         except Exception as e:
             self.logger.error("Error loading state from storage: %s", e)
 
-    def save_state_to_storage(self):
-        """Save current state to storage."""
+    def _migrate_legacy_users(self, users):
+        """Write every user to a per-user key, then drop the legacy blob.
+
+        The legacy key is only deleted once all users were written, so a
+        failing backend leaves it in place for the next start.
+        """
         try:
-            users_data = {}
-            for user in self.distro_list:
-                users_data[user] = {
+            for user in users:
+                self._persist_user(user)
+        except STORAGE_ERRORS as e:
+            self.logger.error("Error migrating users, keeping legacy %r key: %s", LEGACY_USERS_KEY, e)
+            return
+        self.bot.storage.delete(LEGACY_USERS_KEY)
+        self.logger.info("Migrated %d users to per-user storage", len(users))
+
+    def _persist_user(self, user):
+        """Write one user's settings to storage, or delete them if the user left."""
+        with self._state_lock:
+            if user in self.distro_list:
+                user_data = {
                     "groups": list(self.user_groups[user]),
                     "muted_groups": list(self.muted_users[user]),
                 }
-            self.bot.storage.set("users", users_data)
+            else:
+                user_data = None
+        key = USER_KEY_PREFIX + user
+        if user_data is None:
+            self.bot.storage.delete(key)
+        else:
+            self.bot.storage.set(key, user_data)
+
+    def save_state_to_storage(self):
+        """Save every user's settings to storage."""
+        with self._state_lock:
+            users = tuple(self.distro_list)
+        try:
+            for user in users:
+                self._persist_user(user)
             self.logger.debug("Saved state to storage")
         except Exception as e:
             self.logger.error("Error saving state to storage: %s", e)
 
+    def _mark_dirty(self, user):
+        """Record a state change for a user and schedule a debounced save.
+
+        Each change pushes the save back by STATE_FLUSH_DELAY, but never
+        past STATE_FLUSH_MAX_DELAY after the first unsaved change.
+        """
+        now = time.monotonic()
+        with self._dirty_lock:
+            if not self._dirty_users:
+                self._flush_latest = now + STATE_FLUSH_MAX_DELAY
+            self._dirty_users.add(user)
+            self._flush_deadline = min(now + STATE_FLUSH_DELAY, self._flush_latest)
+        self._flush_event.set()
+
+    def flush_state(self):
+        """Write pending user state changes to storage, if there are any."""
+        with self._dirty_lock:
+            dirty, self._dirty_users = self._dirty_users, set()
+            self._flush_event.clear()
+        for user in dirty:
+            try:
+                self._persist_user(user)
+            except STORAGE_ERRORS as e:
+                self.logger.error("Error saving state for %s: %s", user, e)
+
+    def state_flush_loop(self):
+        """Thread loop that saves user state once changes have settled.
+
+        Runs until _flush_stop is set; run() then does the final flush.
+        """
+        while True:
+            self._flush_event.wait()
+            if self._flush_stop.is_set():
+                return
+            delay = self._flush_deadline - time.monotonic()
+            if delay > 0:
+                self._flush_stop.wait(delay)
+                continue
+            self.flush_state()
+
+    def _publish_snapshot(self):
+        """Publish immutable membership views for lock-free broadcast reads.
+
+        Must be called with _state_lock held, after every mutation.
+        """
+        self._snapshot = (
+            frozenset(self.distro_list),
+            {
+                group: frozenset(subscribers - self.group_muted.get(group, set()))
+                for group, subscribers in self.group_subscribers.items()
+            },
+        )
+
+    def _bind(self, user, group):
+        """Subscribe a user to a group in both membership indexes."""
+        self.user_groups[user].add(group)
+        self.group_subscribers[group].add(user)
+
+    def _unbind(self, user, group):
+        """Unsubscribe a user from a group in both membership indexes."""
+        self.user_groups[user].discard(group)
+        self.group_subscribers[group].discard(user)
+
+    def _mute(self, user, group):
+        """Mute a group for a user in both membership indexes."""
+        self.muted_users[user].add(group)
+        self.group_muted[group].add(user)
+
+    def _unmute(self, user, group):
+        """Unmute a group for a user in both membership indexes."""
+        self.muted_users[user].discard(group)
+        self.group_muted[group].discard(user)
+
     def add_to_distro_list(self, user):
         """Add a user to the distribution list."""
-        if user not in self.distro_list:
-            self.distro_list.add(user)
-            default_groups = self.cfg.get(
-                "bot", "default_groups", fallback="",
-            ).split(",")
-            default_groups = [g.strip() for g in default_groups if g.strip()]
-            for group in default_groups:
-                self.user_groups[user].add(group)
-
-            self.save_state_to_storage()
-
-            welcome_msg = "You have been added to the JS8Call message group"
-            if default_groups:
-                welcome_msg += (
-                    f" and the following default groups: {', '.join(default_groups)}"
-                )
-            welcome_msg += ". You will receive messages when they are available."
-            self.bot.send(user, welcome_msg, lxmf_fields=self.icon_lxmf_field)
+        with self._state_lock:
+            added = user not in self.distro_list
+            if added:
+                self.distro_list.add(user)
+                for group in self.config.default_groups:
+                    self._bind(user, group)
+
+                self._publish_snapshot()
+                self._mark_dirty(user)
+
+        if added:
+            self.bot.send(user, self._welcome_msg, lxmf_fields=self.icon_lxmf_field)
 
             self.logger.info("Added %s to distribution list", user)
         else:
@@ -163,13 +366,19 @@ class JS8CallBot:
 
     def remove_from_distro_list(self, user):
         """Remove a user from the distribution list."""
-        if user in self.distro_list:
-            self.distro_list.remove(user)
-            self.user_groups.pop(user, None)
-            self.muted_users.pop(user, None)
-
-            self.save_state_to_storage()
-
+        with self._state_lock:
+            removed = user in self.distro_list
+            if removed:
+                self.distro_list.remove(user)
+                for group in self.user_groups.pop(user, set()):
+                    self.group_subscribers[group].discard(user)
+                for group in self.muted_users.pop(user, set()):
+                    self.group_muted[group].discard(user)
+
+                self._publish_snapshot()
+                self._mark_dirty(user)
+
+        if removed:
             self.bot.send(
                 user,
                 "You have been removed from the JS8Call message group and all groups.",
@@ -181,13 +390,17 @@ class JS8CallBot:
 
     def add_user_to_groups(self, user, groups):
         """Add a user to specified groups."""
-        if user in self.distro_list:
-            for group in groups:
-                if group in self.js8groups or group in self.js8urgent:
-                    self.user_groups[user].add(group)
+        with self._state_lock:
+            member = user in self.distro_list
+            if member:
+                for group in groups:
+                    if group in self._all_groups:
+                        self._bind(user, group)
 
-            self.save_state_to_storage()
+                self._publish_snapshot()
+                self._mark_dirty(user)
 
+        if member:
             self.bot.send(
                 user,
                 f"You have been added to the following groups: {', '.join(groups)}",
@@ -203,11 +416,15 @@ class JS8CallBot:
 
     def remove_user_from_group(self, user, group):
         """Remove a user from a specific group."""
-        if user in self.distro_list and group in self.user_groups[user]:
-            self.user_groups[user].remove(group)
+        with self._state_lock:
+            removed = user in self.distro_list and group in self.user_groups[user]
+            if removed:
+                self._unbind(user, group)
 
-            self.save_state_to_storage()
+                self._publish_snapshot()
+                self._mark_dirty(user)
 
+        if removed:
             self.bot.send(user, f"You have been removed from the group: {group}", lxmf_fields=self.icon_lxmf_field)
             self.logger.info("Removed %s from group: %s", user, group)
         else:
@@ -215,48 +432,53 @@ class JS8CallBot:
 
     def mute_user_groups(self, user, groups):
         """Mute a user from specified groups."""
-        if user in self.distro_list:
-            if "ALL" in [g.upper() for g in groups]:
-                all_groups = set(self.js8groups + self.js8urgent)
-                self.muted_users[user].update(all_groups)
-                self.bot.send(user, "You have muted all available groups.", lxmf_fields=self.icon_lxmf_field)
-                self.logger.info("Muted all groups for %s", user)
-            else:
-                muted = []
-                for group in groups:
-                    if group in self.js8groups or group in self.js8urgent:
-                        self.muted_users[user].add(group)
+        mute_all = any(g.upper() == "ALL" for g in groups)
+        muted = []
+        with self._state_lock:
+            member = user in self.distro_list
+            if member:
+                for group in self._all_groups if mute_all else groups:
+                    if group in self._all_groups:
+                        self._mute(user, group)
                         muted.append(group)
-                if muted:
-                    self.bot.send(user, f"You have muted the following groups: {', '.join(muted)}", lxmf_fields=self.icon_lxmf_field)
-                    self.logger.info("Muted %s for %s", ", ".join(muted), user)
-                else:
-                    self.bot.send(user, "No valid groups to mute.", lxmf_fields=self.icon_lxmf_field)
-            self.save_state_to_storage()
-        else:
+                self._publish_snapshot()
+                self._mark_dirty(user)
+
+        if not member:
             self.bot.send(user, "You need to join the JS8Call message group first. Use /add command.", lxmf_fields=self.icon_lxmf_field)
+        elif mute_all:
+            self.bot.send(user, "You have muted all available groups.", lxmf_fields=self.icon_lxmf_field)
+            self.logger.info("Muted all groups for %s", user)
+        elif muted:
+            self.bot.send(user, f"You have muted the following groups: {', '.join(muted)}", lxmf_fields=self.icon_lxmf_field)
+            self.logger.info("Muted %s for %s", ", ".join(muted), user)
+        else:
+            self.bot.send(user, "No valid groups to mute.", lxmf_fields=self.icon_lxmf_field)
 
     def unmute_user_groups(self, user, groups):
         """Unmute a user from specified groups."""
-        if user in self.distro_list:
-            if "ALL" in [g.upper() for g in groups]:
-                self.muted_users[user].clear()
-                self.bot.send(user, "You have unmuted all groups.", lxmf_fields=self.icon_lxmf_field)
-                self.logger.info("Unmuted all groups for %s", user)
-            else:
-                unmuted = []
-                for group in groups:
+        unmute_all = any(g.upper() == "ALL" for g in groups)
+        unmuted = []
+        with self._state_lock:
+            member = user in self.distro_list
+            if member:
+                for group in tuple(self.muted_users[user]) if unmute_all else groups:
                     if group in self.muted_users[user]:
-                        self.muted_users[user].remove(group)
+                        self._unmute(user, group)
                         unmuted.append(group)
-                if unmuted:
-                    self.bot.send(user, f"You have unmuted the following groups: {', '.join(unmuted)}", lxmf_fields=self.icon_lxmf_field)
-                    self.logger.info("Unmuted %s for %s", ", ".join(unmuted), user)
-                else:
-                    self.bot.send(user, "No valid groups to unmute or they were not muted.", lxmf_fields=self.icon_lxmf_field)
-            self.save_state_to_storage()
-        else:
+                self._publish_snapshot()
+                self._mark_dirty(user)
+
+        if not member:
             self.bot.send(user, "You need to join the JS8Call message group first. Use /add command.", lxmf_fields=self.icon_lxmf_field)
+        elif unmute_all:
+            self.bot.send(user, "You have unmuted all groups.", lxmf_fields=self.icon_lxmf_field)
+            self.logger.info("Unmuted all groups for %s", user)
+        elif unmuted:
+            self.bot.send(user, f"You have unmuted the following groups: {', '.join(unmuted)}", lxmf_fields=self.icon_lxmf_field)
+            self.logger.info("Unmuted %s for %s", ", ".join(unmuted), user)
+        else:
+            self.bot.send(user, "No valid groups to unmute or they were not muted.", lxmf_fields=self.icon_lxmf_field)
 
     def register_commands(self):
         """Register bot command handlers."""
@@ -341,16 +563,21 @@ class JS8CallBot:
         js8call_thread.daemon = True
         js8call_thread.start()
 
+        flush_thread = threading.Thread(target=self.state_flush_loop)
+        flush_thread.daemon = True
+        flush_thread.start()
+
         try:
             self.bot.run()
         except KeyboardInterrupt:
             self.logger.info("Shutting down JS8Call LXMF bot...")
         finally:
-            if self.js8call_socket:
-                try:
-                    self.js8call_socket.close()
-                except Exception:
-                    self.logger.warning("Error closing JS8Call socket during cleanup")
+            self.thread_pool.shutdown(wait=True)
+            self._flush_stop.set()
+            self._flush_event.set()
+            flush_thread.join()
+            self.flush_state()
+            self.disconnect_js8call()
             try:
                 if hasattr(self.bot.storage, "cleanup"):
                     self.bot.storage.cleanup()
@@ -361,6 +588,7 @@ class JS8CallBot:
                     self.db.cleanup()
             except Exception as e:
                 self.logger.warning("Error cleaning up SQLite storage: %s", e)
+            self.log_listener.stop()
 
     def js8call_loop(self):
         """Thread loop for maintaining JS8Call connection and processing messages.
@@ -368,86 +596,129 @@ class JS8CallBot:
         while True:
             if not self.js8call_connected:
                 self.connect_js8call()
-            elif self.js8call_connected:
+                if not self.js8call_connected:
+                    time.sleep(self._reconnect_backoff)
+                    self._reconnect_backoff = min(
+                        self._reconnect_backoff * 2, RECONNECT_BACKOFF_MAX,
+                    )
+            elif self._selector.select(timeout=1.0):
                 self.process_js8call_messages()
-            time.sleep(1)
 
     def connect_js8call(self):
         """Connect to JS8Call instance."""
         self.logger.info("Connecting to JS8Call on %s", self.js8call_server)
-        self.js8call_socket = socket(AF_INET, SOCK_STREAM)
+        self.js8call_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.js8call_socket.connect(self.js8call_server)
+            self.configure_js8call_socket(self.js8call_socket)
+            self.js8call_socket.setblocking(False)
+            self._rx_buf.clear()
+            self._selector.register(self.js8call_socket, selectors.EVENT_READ)
             self.js8call_connected = True
+            self._reconnect_backoff = RECONNECT_BACKOFF_MIN
             self.logger.info("Connected to JS8Call")
         except Exception as e:
             self.logger.error("Failed to connect to JS8Call: %s", e)
-            self.js8call_socket = None
-            self.js8call_connected = False
+            self.disconnect_js8call()
+
+    @staticmethod
+    def configure_js8call_socket(sock):
+        """Disable Nagle and enable TCP keepalive so a dead JS8Call peer is noticed."""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def disconnect_js8call(self):
+        """Close the JS8Call socket and mark the connection as down."""
+        if self.js8call_socket is not None:
+            try:
+                self._selector.unregister(self.js8call_socket)
+            except (KeyError, ValueError):
+                pass
+            try:
+                self.js8call_socket.close()
+            except OSError:
+                self.logger.warning("Error closing JS8Call socket")
+        self.js8call_socket = None
+        self.js8call_connected = False
 
     def process_js8call_messages(self):
-        """Process messages from JS8Call."""
+        """Read available data from JS8Call and handle each complete line."""
         if not self.js8call_connected:
             return
 
         try:
-            data = self.js8call_socket.recv(4096).decode("utf-8")
-            if not data:
-                self.js8call_connected = False
-                self.logger.warning("JS8Call connection lost")
-                return
+            received = self.js8call_socket.recv_into(self._rx_chunk)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.logger.error("Error reading from JS8Call: %s", e)
+            self.disconnect_js8call()
+            return
 
-            messages = data.strip().split("\n")
-            for message in messages:
-                try:
-                    if not message:
-                        continue
-                    msg_data = json.loads(message)
-                    self.handle_js8call_message(msg_data)
-                except json.JSONDecodeError as e:
-                    self.logger.error("Failed to parse JS8Call message: %s", e)
-                    continue
+        if not received:
+            self.logger.warning("JS8Call connection lost")
+            self.disconnect_js8call()
+            return
 
-        except Exception as e:
-            self.logger.error("Error processing JS8Call messages: %s", e)
-            self.js8call_connected = False
+        self._rx_buf += self._rx_chunk[:received]
+        while (end := self._rx_buf.find(b"\n")) >= 0:
+            line = self._rx_buf[:end].strip()
+            del self._rx_buf[:end + 1]
+            if not line or b'"RX.DIRECTED"' not in line:
+                continue
+            try:
+                msg_data = json.loads(line)
+            except ValueError as e:
+                self.logger.error("Failed to parse JS8Call message: %s", e)
+                continue
+            try:
+                self.handle_js8call_message(msg_data)
+            except (OSError, RuntimeError) as e:
+                # Forwarding failed, e.g. a send error or the pool shutting down.
+                self.logger.error("Error processing JS8Call message: %s", e)
+
+        if len(self._rx_buf) > MAX_FRAME_LENGTH:
+            self.logger.warning(
+                "Discarding %d bytes from JS8Call without a newline", len(self._rx_buf),
+            )
+            self._rx_buf.clear()
 
     def handle_js8call_message(self, data):
         """Handle a single JS8Call message."""
         try:
             if data["type"] == "RX.DIRECTED":
-                parts = data["value"].split(":")
-                if len(parts) < 2:
+                sender, separator, content = data["value"].partition(":")
+                if not separator:
                     self.logger.warning(
                         "Invalid directed message format: %s", data["value"],
                     )
                     return
 
-                sender = parts[0].strip()
-                content = ":".join(parts[1:]).strip()
-
-                if any(word.lower() in content.lower() for word in self.blocked_words):
+                if self._blocked_re and self._blocked_re.search(content):
                     self.logger.info(
-                        "Message from %s contains blocked words. Skipping.", sender,
+                        "Message from %s contains blocked words. Skipping.",
+                        sender.strip(),
                     )
                     return
 
-                if any(content.startswith(group) for group in self.js8groups):
-                    for group in self.js8groups:
-                        if content.startswith(group):
-                            message = content[len(group):].strip()
-                            self.forward_group_message(sender, group, message)
-                            break
-                elif any(content.startswith(group) for group in self.js8urgent):
-                    for group in self.js8urgent:
-                        if content.startswith(group):
-                            message = content[len(group):].strip()
-                            self.forward_urgent_message(sender, group, message)
-                            break
+                sender = sender.strip()
+                content = content.strip()
+
+                match = self._group_re.match(content) if self._group_re else None
+                if match:
+                    group = match.group("g")
+                    message = content[match.end():].strip()
+                    if self._group_kind[group] == "urgent":
+                        self.forward_urgent_message(sender, group, message)
+                    else:
+                        self.forward_group_message(sender, group, message)
                 else:
                     self.forward_direct_message(sender, content)
 
-        except (KeyError, ValueError) as e:
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
             self.logger.error("Error handling JS8Call message: %s", e)
 
     def forward_direct_message(self, sender: str, message: str):
@@ -474,26 +745,41 @@ class JS8CallBot:
     def _send_to_users(self, message: str, group: str = None):
         """Send a message to all users or group subscribers.
         If group is None, send to all users. Otherwise, send to users subscribed to the group and not muted.
+
+        Recipients are handed to the thread pool in batches of at most
+        SEND_QUEUE_FACTOR tasks per worker, so a large broadcast never queues
+        more than that many pending sends. This trades a little latency on
+        big broadcasts for memory that stays proportional to the pool size.
         """
-        for user in self.distro_list:
-            if group is None or (
-                group in self.user_groups[user] and group not in self.muted_users[user]
-            ):
-                self.bot.send(user, message, lxmf_fields=self.icon_lxmf_field)
+        distro, group_recipients = self._snapshot
+        if group is None:
+            recipients = distro
+        else:
+            recipients = group_recipients.get(group, frozenset())
+        if not recipients:
+            return
+        send = functools.partial(
+            self.bot.send, message=message, lxmf_fields=self.icon_lxmf_field,
+        )
+        recipients = tuple(recipients)
+        batch_size = self._send_batch_size
+        for start in range(0, len(recipients), batch_size):
+            for _ in self.thread_pool.map(send, recipients[start:start + batch_size]):
+                pass
 
     def show_groups(self, user):
         """Show available groups and user's subscriptions."""
-        available_groups = set(self.js8groups + self.js8urgent)
+        available_groups = self._all_groups
         user_groups = self.user_groups.get(user, set())
         muted_groups = self.muted_users.get(user, set())
 
-        output = "Available groups:\n"
+        lines = ["Available groups:\n"]
         for group in available_groups:
             status = "[Subscribed]" if group in user_groups else "[Not subscribed]"
             if group in muted_groups:
                 status += " [Muted]"
-            output += f"{group} {status}\n"
-        return output
+            lines.append(f"{group} {status}\n")
+        return "".join(lines)
 
     def show_info(self):
         """Show bot information."""
@@ -510,46 +796,35 @@ class JS8CallBot:
     def show_log(self, num_messages):
         """Show recent messages."""
         num_messages = min(int(num_messages), 50)
-        messages = self.execute_db_query(
-            """
-            SELECT sender, receiver, message, timestamp
-            FROM (
-                SELECT sender, receiver, message, timestamp FROM messages
-                UNION ALL
-                SELECT sender, groupname as receiver, message, timestamp FROM groups
-                UNION ALL
-                SELECT sender, groupname as receiver, message, timestamp FROM urgent
-            )
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """,
-            (num_messages,),
-        )
+        messages = self.db.execute_db_query(RECENT_MESSAGES_QUERY, (num_messages,))
 
-        log_output = f"Last {len(messages)} messages:\n\n"
-        for msg in reversed(messages):
-            log_output += f"[{msg[3]}] From {msg[0]} to {msg[1]}: {msg[2]}\n\n"
-        return log_output
+        lines = [f"Last {len(messages)} messages:\n\n"]
+        lines.extend(
+            f"[{datetime.fromtimestamp(msg['timestamp']):%Y-%m-%d %H:%M:%S}] "
+            f"From {msg['sender']} to {msg['receiver']}: {msg['message']}\n\n"
+            for msg in reversed(messages)
+        )
+        return "".join(lines)
 
     def show_stats(self, period=None):
         """Show statistics for the specified period."""
         current_users = len(self.distro_list)
         output = f"Current users: {current_users}\n"
 
+        now = datetime.now()
         if period == "day":
-            date = datetime.now().strftime("%Y-%m-%d")
-            stats = self.execute_db_query(
-                "SELECT user_count FROM stats WHERE date = ?", (date,),
-            )
+            date = now.strftime("%Y-%m-%d")
+            stats = self.db.execute_db_query(DAILY_USERS_QUERY, (date,))
             if stats:
                 output += f"Users today: {stats[0][0]}\n"
             else:
                 output += "No data for today\n"
         elif period == "month":
-            current_month = datetime.now().strftime("%Y-%m")
-            stats = self.execute_db_query(
-                "SELECT AVG(user_count) FROM stats WHERE date LIKE ?",
-                (f"{current_month}%",),
+            start_of_month = now.replace(day=1)
+            next_month = (start_of_month + timedelta(days=32)).replace(day=1)
+            stats = self.db.execute_db_query(
+                AVERAGE_USERS_QUERY,
+                (start_of_month.strftime("%Y-%m-%d"), next_month.strftime("%Y-%m-%d")),
             )
             if stats and stats[0][0] is not None:
                 avg_users = round(stats[0][0], 2)
@@ -559,45 +834,44 @@ class JS8CallBot:
 
         return output
 
+    def _message_counts(self, query, params=()):
+        """Run a per-table count query and return the counts keyed by message kind."""
+        counts = {"direct": 0, "group": 0, "urgent": 0}
+        counts.update(self.db.execute_db_query(query, params))
+        return counts
+
     def show_analytics(self, period=None):
         """Show usage statistics for the specified period."""
         output = "Usage Statistics:\n"
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
         if period == "day":
-            date = datetime.now().strftime("%Y-%m-%d")
-            messages_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM messages WHERE DATE(timestamp) = ?", (date,),
-            )
-            groups_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM groups WHERE DATE(timestamp) = ?", (date,),
-            )
-            urgent_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM urgent WHERE DATE(timestamp) = ?", (date,),
+            counts = self._message_counts(
+                MESSAGE_COUNTS_RANGE_QUERY,
+                {
+                    "start": int(today.timestamp()),
+                    "end": int((today + timedelta(days=1)).timestamp()),
+                },
             )
-            output += f"Messages today: {messages_count[0][0] if messages_count else 0}\n"
-            output += f"Group messages today: {groups_count[0][0] if groups_count else 0}\n"
-            output += f"Urgent messages today: {urgent_count[0][0] if urgent_count else 0}\n"
+            output += f"Messages today: {counts['direct']}\n"
+            output += f"Group messages today: {counts['group']}\n"
+            output += f"Urgent messages today: {counts['urgent']}\n"
         elif period == "week":
-            start_of_week = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime("%Y-%m-%d")
-            end_of_week = (datetime.now() + timedelta(days=(6 - datetime.now().weekday()))).strftime("%Y-%m-%d")
-            messages_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM messages WHERE DATE(timestamp) BETWEEN ? AND ?", (start_of_week, end_of_week),
-            )
-            groups_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM groups WHERE DATE(timestamp) BETWEEN ? AND ?", (start_of_week, end_of_week),
-            )
-            urgent_count = self.execute_db_query(
-                "SELECT COUNT(*) FROM urgent WHERE DATE(timestamp) BETWEEN ? AND ?", (start_of_week, end_of_week),
+            start_of_week = today - timedelta(days=today.weekday())
+            counts = self._message_counts(
+                MESSAGE_COUNTS_RANGE_QUERY,
+                {
+                    "start": int(start_of_week.timestamp()),
+                    "end": int((start_of_week + timedelta(days=7)).timestamp()),
+                },
             )
-            output += f"Messages this week: {messages_count[0][0] if messages_count else 0}\n"
-            output += f"Group messages this week: {groups_count[0][0] if groups_count else 0}\n"
-            output += f"Urgent messages this week: {urgent_count[0][0] if urgent_count else 0}\n"
+            output += f"Messages this week: {counts['direct']}\n"
+            output += f"Group messages this week: {counts['group']}\n"
+            output += f"Urgent messages this week: {counts['urgent']}\n"
         else:
-            total_messages = self.execute_db_query("SELECT COUNT(*) FROM messages")
-            total_groups = self.execute_db_query("SELECT COUNT(*) FROM groups")
-            total_urgent = self.execute_db_query("SELECT COUNT(*) FROM urgent")
-            output += f"Total direct messages: {total_messages[0][0] if total_messages else 0}\n"
-            output += f"Total group messages: {total_groups[0][0] if total_groups else 0}\n"
-            output += f"Total urgent messages: {total_urgent[0][0] if total_urgent else 0}\n"
+            counts = self._message_counts(MESSAGE_COUNTS_QUERY)
+            output += f"Total direct messages: {counts['direct']}\n"
+            output += f"Total group messages: {counts['group']}\n"
+            output += f"Total urgent messages: {counts['urgent']}\n"
         return output
 
 
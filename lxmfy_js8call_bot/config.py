@@ -0,0 +1,63 @@
+"""Configuration loading for the JS8Call LXMF bot."""
+
+import configparser
+from dataclasses import dataclass
+
+
+def _split_list(value: str) -> tuple[str, ...]:
+    """Split a comma-separated option into a tuple of non-empty, stripped items."""
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+@dataclass(slots=True, frozen=True)
+class BotConfig:
+    """Immutable snapshot of the values read from ``config.ini``."""
+
+    name: str
+    announce_interval: int
+    admins: tuple[str, ...]
+    signature_verification_enabled: bool
+    require_message_signatures: bool
+    store_users_in_db: bool
+    default_groups: tuple[str, ...]
+    blocked_words: tuple[str, ...]
+    db_file: str
+    host: str
+    port: int
+    js8groups: tuple[str, ...]
+    js8urgent: tuple[str, ...]
+
+
+def load_config(path: str = "config.ini") -> BotConfig:
+    """Read the bot configuration file once and freeze it into a BotConfig.
+
+    Args:
+        path: Path to the INI configuration file
+
+    Returns:
+        The parsed configuration with defaults applied for missing options
+
+    """
+    cfg = configparser.ConfigParser()
+    cfg.read(path)
+
+    return BotConfig(
+        name=cfg.get("bot", "name", fallback="JS8Call-Bot"),
+        announce_interval=cfg.getint("bot", "announce_interval", fallback=360),
+        admins=_split_list(cfg.get("bot", "allowed_users", fallback="")),
+        signature_verification_enabled=cfg.getboolean(
+            "bot", "signature_verification_enabled", fallback=False,
+        ),
+        require_message_signatures=cfg.getboolean(
+            "bot", "require_message_signatures", fallback=False,
+        ),
+        store_users_in_db=cfg.get("bot", "store_users_in_db", fallback="no").lower()
+        in ("yes", "true", "1"),
+        default_groups=_split_list(cfg.get("bot", "default_groups", fallback="")),
+        blocked_words=_split_list(cfg.get("bot", "blocked_words", fallback="")),
+        db_file=cfg.get("js8call", "db_file", fallback="js8call.db"),
+        host=cfg.get("js8call", "host", fallback="localhost"),
+        port=cfg.getint("js8call", "port", fallback=2442),
+        js8groups=_split_list(cfg.get("js8call", "js8groups", fallback="")),
+        js8urgent=_split_list(cfg.get("js8call", "js8urgent", fallback="")),
+    )
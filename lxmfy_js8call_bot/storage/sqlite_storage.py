@@ -1,14 +1,64 @@
 """SQLite storage backend for the JS8Call LXMF bot."""
 
 import ast
+import atexit
 import json
 import logging
 import sqlite3
+import sys
 import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext, suppress
 from typing import Any
 
 from lxmfy.storage import StorageBackend
 
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+SCHEMA_VERSION = 4
+STATEMENT_CACHE_SIZE = 256
+MESSAGE_FLUSH_INTERVAL = 0.05
+MESSAGE_QUEUE_SIZE = 10000
+WAL_CHECKPOINT_INTERVAL = 60.0
+VALUE_CACHE_SIZE = 1024
+
+_NOT_CACHED = object()
+_encode_value = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Return the smallest string greater than every string starting with prefix.
+
+    Used to turn a prefix match into an index-friendly ``key >= prefix AND
+    key < bound`` range. Returns None when no such bound exists (empty prefix
+    or a prefix made only of U+10FFFF).
+
+    >>> _prefix_upper_bound("js8call_user_")
+    'js8call_user`'
+    >>> _prefix_upper_bound("a\\ud7ff") == "a\\ue000"
+    True
+    >>> _prefix_upper_bound("a\\U0010ffff")
+    'b'
+    >>> _prefix_upper_bound("\\U0010ffff\\U0010ffff") is None
+    True
+    """
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped:
+        return None
+    next_char = ord(stripped[-1]) + 1
+    if 0xD800 <= next_char <= 0xDFFF:
+        next_char = 0xE000
+    return stripped[:-1] + chr(next_char)
+
 
 class SQLiteStorage(StorageBackend):
     """SQLite implementation of the StorageBackend interface."""
@@ -21,32 +71,197 @@ class SQLiteStorage(StorageBackend):
 
         """
         self.db_file = db_file
-        self.db_lock = threading.Lock()
+        self.db_lock = threading.RLock()
+        self._tls = threading.local()
+        self._shared_conn = None
         self.logger = logging.getLogger(__name__)
+        self._log_error = self.logger.error
+        self._pending_messages = deque()
+        self._pending_event = threading.Event()
+        self._closing = False
+        self._closed = False
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_version = 0
         self.setup_database()
+        self._flush_thread = threading.Thread(
+            target=self._message_flush_loop, name="sqlite-message-flush", daemon=True,
+        )
+        self._flush_thread.start()
+        self._checkpoint_stop = threading.Event()
+        self._checkpoint_thread = None
+        if self._shared_conn is None:
+            self._checkpoint_thread = threading.Thread(
+                target=self._checkpoint_loop, name="sqlite-wal-checkpoint", daemon=True,
+            )
+            self._checkpoint_thread.start()
+        atexit.register(self.cleanup)
+
+    def __enter__(self):
+        """Return the storage itself for use in a with block."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Close the storage when the with block exits."""
+        self.cleanup()
 
     def setup_database(self):
-        """Initialize database connection and create tables."""
+        """Initialize database connection and create tables.
+
+        The schema version is kept in PRAGMA user_version, so on an
+        up-to-date database this is a single PRAGMA read.
+        """
+        if self.db_file == ":memory:":
+            self._shared_conn = self._connect(check_same_thread=False)
         with self.db_lock:
-            self.db_conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            conn = self._conn()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
             self.create_tables()
+            self.migrate_user_groups_subscribed()
+            self.migrate_user_groups()
+            self.migrate_storage_values()
+            self.migrate_storage_without_rowid()
+            self.migrate_epoch_timestamps()
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """Open and configure a new connection to the database file.
+
+        Args:
+            check_same_thread: Whether sqlite3 rejects use from other threads;
+                only the shared in-memory connection turns this off
+
+        """
+        conn = sqlite3.connect(
+            self.db_file,
+            check_same_thread=check_same_thread,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.isolation_level = None
+        conn.row_factory = sqlite3.Row
+        self.configure_connection(conn)
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use.
+
+        Each thread gets its own connection so reads run in parallel and
+        SQLite's own locking arbitrates between them. The connection is only
+        referenced from the thread-local, so it is closed as soon as its
+        thread exits (e.g. a threaded command or a finished pool worker);
+        using it from another thread raises. In-memory databases cannot be
+        shared between connections, so every thread uses one shared
+        connection.
+        """
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = self._tls.conn = self._connect()
+        return conn
+
+    def _close_thread_conn(self) -> None:
+        """Close the calling thread's connection, if it has opened one."""
+        conn = self._tls.__dict__.pop("conn", None)
+        if conn is not None:
+            conn.close()
+
+    @contextmanager
+    def _reader(self):
+        """Provide a connection for a read-only block.
+
+        Per-thread connections need no Python-level lock. The shared
+        in-memory connection is used under db_lock.
+        """
+        if self._shared_conn is None:
+            yield self._conn()
+            return
+        with self.db_lock:
+            yield self._shared_conn
+
+    @contextmanager
+    def _write(self):
+        """Run a block in a BEGIN IMMEDIATE transaction on this thread's connection.
+
+        The write lock is taken up front, so the transaction cannot fail with
+        SQLITE_BUSY on upgrade. It is committed when the block succeeds and
+        rolled back if the block raises.
+        """
+        with self.db_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _cache_store(self, key: str, raw: str | None, version: int | None = None) -> None:
+        """Remember the stored text for a key (None if the key is absent).
+
+        Writers call this after committing, still holding db_lock so
+        concurrent writes to one key are cached in commit order, and without
+        a version, which also bumps the cache version. Readers pass the
+        version they saw before querying, and their entry is dropped if a
+        write committed since, so a slow reader cannot cache a value that
+        was already replaced.
+        """
+        with self._cache_lock:
+            if version is None:
+                self._cache_version += 1
+            elif version != self._cache_version:
+                return
+            self._cache[key] = raw
+            self._cache.move_to_end(key)
+            while len(self._cache) > VALUE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _lookup_raw(self, key: str) -> str | None:
+        """Return the stored text for a key, consulting the cache first."""
+        with self._cache_lock:
+            raw = self._cache.get(key, _NOT_CACHED)
+            if raw is not _NOT_CACHED:
+                self._cache.move_to_end(key)
+                return raw
+            version = self._cache_version
+        with self._reader() as conn:
+            result = conn.execute(
+                "SELECT value FROM storage WHERE key = ?", (key,),
+            ).fetchone()
+        raw = result[0] if result else None
+        self._cache_store(key, raw, version)
+        return raw
+
+    @staticmethod
+    def configure_connection(conn: sqlite3.Connection) -> None:
+        """Apply WAL journaling and cache tuning to a new connection.
+
+        Args:
+            conn: Freshly opened SQLite connection
+
+        """
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
 
     def create_tables(self):
         """Create necessary database tables if they don't exist."""
-        with self.db_conn:
-            self.db_conn.executescript(
+        with self._conn() as conn:
+            conn.executescript(
                 """
                 CREATE TABLE IF NOT EXISTS storage (
                     key TEXT PRIMARY KEY,
                     value TEXT
-                );
+                ) WITHOUT ROWID;
 
                 CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     sender TEXT,
                     receiver TEXT,
                     message TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
                     processed INTEGER DEFAULT 0
                 );
 
@@ -55,7 +270,7 @@ class SQLiteStorage(StorageBackend):
                     sender TEXT,
                     groupname TEXT,
                     message TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
                     processed INTEGER DEFAULT 0
                 );
 
@@ -64,7 +279,7 @@ class SQLiteStorage(StorageBackend):
                     sender TEXT,
                     groupname TEXT,
                     message TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
                     processed INTEGER DEFAULT 0
                 );
 
@@ -75,14 +290,170 @@ class SQLiteStorage(StorageBackend):
                     muted_groups TEXT
                 );
 
+                CREATE TABLE IF NOT EXISTS user_groups (
+                    user_hash TEXT,
+                    group_name TEXT,
+                    subscribed INTEGER NOT NULL DEFAULT 1,
+                    muted INTEGER DEFAULT 0,
+                    PRIMARY KEY (user_hash, group_name)
+                ) WITHOUT ROWID;
+
                 CREATE TABLE IF NOT EXISTS stats (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     date TEXT UNIQUE,
                     user_count INTEGER
                 );
+
+                CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+                CREATE INDEX IF NOT EXISTS idx_groups_timestamp ON groups(timestamp);
+                CREATE INDEX IF NOT EXISTS idx_urgent_timestamp ON urgent(timestamp);
+
+                CREATE INDEX IF NOT EXISTS idx_messages_unprocessed ON messages(id) WHERE processed = 0;
+                CREATE INDEX IF NOT EXISTS idx_groups_unprocessed ON groups(id) WHERE processed = 0;
+                CREATE INDEX IF NOT EXISTS idx_urgent_unprocessed ON urgent(id) WHERE processed = 0;
             """,
             )
 
+    def migrate_user_groups_subscribed(self) -> None:
+        """Add the subscribed column to a user_groups table created without it."""
+        with self._write() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(user_groups)")}
+            if "subscribed" not in columns:
+                conn.execute(
+                    "ALTER TABLE user_groups ADD COLUMN subscribed INTEGER NOT NULL DEFAULT 1",
+                )
+
+    def migrate_user_groups(self) -> None:
+        """Copy memberships from the legacy users columns into user_groups.
+
+        Runs only while user_groups is still empty, so it is a no-op once the
+        data has been moved. Groups that are muted without being subscribed
+        get a row with subscribed = 0. The legacy columns are left in place
+        but are no longer read.
+        """
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM user_groups LIMIT 1").fetchone():
+                return
+            rows = []
+            for user_hash, groups, muted_groups in conn.execute(
+                "SELECT user_hash, groups, muted_groups FROM users",
+            ):
+                subscribed = {g.strip() for g in (groups or "").split(",") if g.strip()}
+                muted = {g.strip() for g in (muted_groups or "").split(",") if g.strip()}
+                rows.extend(
+                    (user_hash, group, int(group in subscribed), int(group in muted))
+                    for group in subscribed | muted
+                )
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO user_groups (user_hash, group_name, subscribed, muted)
+                VALUES (?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+    def migrate_storage_values(self) -> None:
+        """Re-encode stored values as compact JSON.
+
+        Values written by older versions may be Python reprs or spaced JSON.
+        Rows that literal_eval cannot parse either are left untouched.
+        """
+        updates = []
+        with self._reader() as conn:
+            for key, raw in conn.execute("SELECT key, value FROM storage"):
+                if not isinstance(raw, str):
+                    continue
+                try:
+                    value = json.loads(raw)
+                except json.JSONDecodeError:
+                    try:
+                        value = ast.literal_eval(raw)
+                    except (ValueError, SyntaxError):
+                        continue
+                try:
+                    encoded = _encode_value(value)
+                except (TypeError, ValueError):
+                    continue
+                if encoded != raw:
+                    updates.append((encoded, key))
+        if updates:
+            with self._write() as conn:
+                conn.executemany("UPDATE storage SET value = ? WHERE key = ?", updates)
+            self.logger.info("Re-encoded %d storage values as compact JSON", len(updates))
+
+    def migrate_storage_without_rowid(self) -> None:
+        """Rebuild a legacy rowid storage table as a WITHOUT ROWID table.
+
+        A WITHOUT ROWID table keeps rows in a single b-tree keyed on key,
+        instead of a primary key index pointing into a separate rowid table.
+        """
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'storage'",
+            ).fetchone()
+            if row is None or "WITHOUT ROWID" in row[0].upper():
+                return
+            conn.execute(
+                "CREATE TABLE storage_new (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID",
+            )
+            conn.execute(
+                "INSERT INTO storage_new (key, value) "
+                "SELECT key, value FROM storage WHERE key IS NOT NULL",
+            )
+            conn.execute("DROP TABLE storage")
+            conn.execute("ALTER TABLE storage_new RENAME TO storage")
+        self.logger.info("Rebuilt storage table as WITHOUT ROWID")
+
+    def migrate_epoch_timestamps(self) -> None:
+        """Rebuild message tables that still store timestamps as ISO-8601 text.
+
+        Each table is copied into a new one whose timestamp column holds
+        integer seconds since the epoch (UTC), converting existing rows.
+        Rows whose timestamp cannot be parsed get 0.
+        """
+        tables = {"messages": "receiver", "groups": "groupname", "urgent": "groupname"}
+        with self._write() as conn:
+            for table, target in tables.items():
+                row = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (table,),
+                ).fetchone()
+                if row is None or "TIMESTAMP INTEGER" in row[0].upper():
+                    continue
+                conn.execute(
+                    f"""
+                    CREATE TABLE {table}_new (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        sender TEXT,
+                        {target} TEXT,
+                        message TEXT,
+                        timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+                        processed INTEGER DEFAULT 0
+                    )
+                    """,
+                )
+                conn.execute(
+                    f"""
+                    INSERT INTO {table}_new (id, sender, {target}, message, timestamp, processed)
+                    SELECT id, sender, {target}, message,
+                           COALESCE(
+                               CASE WHEN typeof(timestamp) = 'text'
+                                    THEN strftime('%s', timestamp)
+                                    ELSE CAST(timestamp AS INTEGER) END,
+                               0
+                           ),
+                           processed
+                    FROM {table}
+                    """,
+                )
+                conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+                conn.execute(f"CREATE INDEX idx_{table}_timestamp ON {table}(timestamp)")
+                conn.execute(
+                    f"CREATE INDEX idx_{table}_unprocessed ON {table}(id) WHERE processed = 0",
+                )
+                self.logger.info("Converted %s timestamps to epoch seconds", table)
+
     def get(self, key: str, default: Any = None) -> Any:
         """Retrieve a value from storage.
 
@@ -94,27 +465,22 @@ class SQLiteStorage(StorageBackend):
             The stored value or default if not found
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
+        try:
+            raw = self._lookup_raw(key)
+        except sqlite3.DatabaseError as e:
+            self._log_error("Error getting key %s: %s", key, e)
+            return default
+        if raw is None:
+            return default
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            self.logger.warning("Could not decode JSON for key %s, attempting literal_eval.", key)
             try:
-                cursor.execute("SELECT value FROM storage WHERE key = ?", (key,))
-                result = cursor.fetchone()
-                if result:
-                    try:
-                        return json.loads(result[0])
-                    except json.JSONDecodeError:
-                        self.logger.warning("Could not decode JSON for key %s, attempting literal_eval.", key)
-                        try:
-                            return ast.literal_eval(result[0])
-                        except (ValueError, SyntaxError):
-                            self.logger.error("Could not literal_eval for key %s, returning raw string.", key)
-                            return result[0]
-                return default
-            except Exception as e:
-                self.logger.error("Error getting key %s: %s", key, e)
-                return default
-            finally:
-                cursor.close()
+                return ast.literal_eval(raw)
+            except (ValueError, SyntaxError):
+                self._log_error("Could not literal_eval for key %s, returning raw string.", key)
+                return raw
 
     def set(self, key: str, value: Any) -> None:
         """Store a value in storage.
@@ -124,19 +490,18 @@ class SQLiteStorage(StorageBackend):
             value: The value to store
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO storage (key, value) VALUES (?, ?)",
-                    (key, json.dumps(value)),
-                )
-                self.db_conn.commit()
-            except Exception as e:
-                self.logger.error("Error setting key %s: %s", key, e)
-                raise
-            finally:
-                cursor.close()
+        raw = _encode_value(value)
+        try:
+            with self.db_lock:
+                with self._write() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO storage (key, value) VALUES (?, ?)",
+                        (key, raw),
+                    )
+                self._cache_store(key, raw)
+        except sqlite3.DatabaseError as e:
+            self._log_error("Error setting key %s: %s", key, e)
+            raise
 
     def delete(self, key: str) -> None:
         """Delete a value from storage.
@@ -145,16 +510,14 @@ class SQLiteStorage(StorageBackend):
             key: The key to delete
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute("DELETE FROM storage WHERE key = ?", (key,))
-                self.db_conn.commit()
-            except Exception as e:
-                self.logger.error("Error deleting key %s: %s", key, e)
-                raise
-            finally:
-                cursor.close()
+        try:
+            with self.db_lock:
+                with self._write() as conn:
+                    conn.execute("DELETE FROM storage WHERE key = ?", (key,))
+                self._cache_store(key, None)
+        except sqlite3.DatabaseError as e:
+            self._log_error("Error deleting key %s: %s", key, e)
+            raise
 
     def exists(self, key: str) -> bool:
         """Check if a key exists in storage.
@@ -166,13 +529,19 @@ class SQLiteStorage(StorageBackend):
             True if key exists, False otherwise
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute("SELECT 1 FROM storage WHERE key = ?", (key,))
-                return cursor.fetchone() is not None
-            finally:
-                cursor.close()
+        with self._cache_lock:
+            raw = self._cache.get(key, _NOT_CACHED)
+            if raw is not _NOT_CACHED:
+                self._cache.move_to_end(key)
+                return raw is not None
+            version = self._cache_version
+        with self._reader() as conn:
+            found = conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM storage WHERE key = ?)", (key,),
+            ).fetchone()[0]
+        if not found:
+            self._cache_store(key, None, version)
+        return bool(found)
 
     def scan(self, prefix: str) -> list:
         """Scan for keys with a given prefix.
@@ -184,18 +553,45 @@ class SQLiteStorage(StorageBackend):
             List of matching keys
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute(
-                    "SELECT key FROM storage WHERE key LIKE ?", (f"{prefix}%",),
-                )
-                return [row[0] for row in cursor.fetchall()]
-            finally:
-                cursor.close()
+        upper = _prefix_upper_bound(prefix)
+        with self._reader() as conn:
+            if upper is None:
+                rows = conn.execute(
+                    "SELECT key FROM storage WHERE key >= ? ORDER BY key", (prefix,),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT key FROM storage WHERE key >= ? AND key < ? ORDER BY key",
+                    (prefix, upper),
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def execute_db_query(self, query: str, params: tuple | dict = ()) -> list:
+        """Run a read query and return all resulting rows.
+
+        Callers should pass the same query string for repeated queries so
+        sqlite3's per-connection statement cache can reuse the prepared
+        statement.
+
+        Args:
+            query: SQL query to execute
+            params: Positional or named query parameters
+
+        Returns:
+            List of result rows
+
+        """
+        with self._reader() as conn:
+            return conn.execute(query, params).fetchall()
 
     def insert_message(self, sender: str, receiver: str, message: str) -> None:
-        """Insert a new message into the database.
+        """Queue a new message for insertion into the database.
+
+        Messages are written in batches by a background thread roughly every
+        MESSAGE_FLUSH_INTERVAL seconds; call flush_messages() to write them
+        immediately. If MESSAGE_QUEUE_SIZE messages are already waiting, or
+        cleanup() has already run, the message is dropped and a warning is
+        logged.
 
         Args:
             sender: Message sender
@@ -203,31 +599,124 @@ class SQLiteStorage(StorageBackend):
             message: Message content
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
+        if self._closed:
+            self.logger.warning("Storage is closed, dropping message from %s", sender)
+            return
+        if len(self._pending_messages) >= MESSAGE_QUEUE_SIZE:
+            self.logger.warning("Message queue is full, dropping message from %s", sender)
+            return
+        self._pending_messages.append((sender, receiver, message))
+        self._pending_event.set()
+
+    def insert_messages(self, rows: list[tuple[str, str, str]]) -> None:
+        """Insert several messages in a single transaction.
+
+        Args:
+            rows: (sender, receiver, message) tuples to insert
+
+        """
+        with self._write() as conn:
+            conn.executemany(
+                "INSERT INTO messages (sender, receiver, message) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def flush_messages(self) -> None:
+        """Write all queued messages in a single transaction.
+
+        If the batch fails, its rows are retried one at a time. A row that
+        fails with sqlite3.OperationalError (e.g. the database is locked) is
+        put back at the front of the queue for the next flush; any other
+        failure, such as text SQLite cannot encode, drops the row with an
+        error logged.
+        """
+        rows = []
+        while self._pending_messages:
+            rows.append(self._pending_messages.popleft())
+        if not rows:
+            return
+        try:
+            self.insert_messages(rows)
+            return
+        except (sqlite3.Error, ValueError) as e:
+            self._log_error("Error writing %d queued messages, retrying one by one: %s", len(rows), e)
+        retry = []
+        for row in rows:
             try:
-                cursor.execute(
-                    "INSERT INTO messages (sender, receiver, message) VALUES (?, ?, ?)",
-                    (sender, receiver, message),
-                )
-                self.db_conn.commit()
-            finally:
+                self.insert_messages([row])
+            except sqlite3.OperationalError as e:
+                retry.append(row)
+                self._log_error("Error writing message from %s, will retry: %s", row[0], e)
+            except (sqlite3.Error, ValueError) as e:
+                self._log_error("Dropping message from %s that cannot be stored: %s", row[0], e)
+        self._pending_messages.extendleft(reversed(retry))
+
+    def _message_flush_loop(self):
+        """Background loop that batches queued messages into one commit."""
+        while not self._closing:
+            self._pending_event.wait()
+            self._pending_event.clear()
+            time.sleep(MESSAGE_FLUSH_INTERVAL)
+            try:
+                self.flush_messages()
+            except Exception:
+                self.logger.exception("Unexpected error in message flush loop")
+        self._close_thread_conn()
+
+    def _checkpoint_loop(self):
+        """Background loop that periodically truncates the WAL file.
+
+        Automatic checkpoints copy pages back but never shrink the -wal
+        file, and a busy ingest can keep it growing. A TRUNCATE checkpoint
+        resets it to zero bytes when no reader is using it.
+        """
+        while not self._checkpoint_stop.wait(WAL_CHECKPOINT_INTERVAL):
+            try:
+                with self.db_lock:
+                    self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                self._log_error("WAL checkpoint failed: %s", e)
+        self._close_thread_conn()
+
+    def iter_unprocessed_messages(self, batch: int = 1000) -> Iterator[sqlite3.Row]:
+        """Yield unprocessed messages, fetching them in batches.
+
+        Only one batch is held in memory at a time. The read transaction
+        stays open until the generator is exhausted or closed. With the
+        shared in-memory connection, db_lock is held only while a batch is
+        fetched, never across a yield.
+
+        Args:
+            batch: Number of rows fetched from SQLite per round trip
+
+        Yields:
+            sqlite3.Row objects with id, sender, receiver and message
+
+        """
+        lock = self.db_lock if self._shared_conn is not None else nullcontext()
+        with lock:
+            cursor = self._conn().execute(
+                "SELECT id, sender, receiver, message FROM messages WHERE processed = 0",
+            )
+        try:
+            while True:
+                with lock:
+                    rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            with lock, suppress(sqlite3.ProgrammingError):
                 cursor.close()
 
     def get_unprocessed_messages(self) -> list:
         """Retrieve all unprocessed messages.
 
         Returns:
-            List of unprocessed messages
+            List of sqlite3.Row objects with id, sender, receiver and message
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute("SELECT * FROM messages WHERE processed = 0")
-                return cursor.fetchall()
-            finally:
-                cursor.close()
+        return list(self.iter_unprocessed_messages())
 
     def mark_message_processed(self, message_id: int) -> None:
         """Mark a message as processed.
@@ -236,70 +725,182 @@ class SQLiteStorage(StorageBackend):
             message_id: ID of the message to mark
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute(
-                    "UPDATE messages SET processed = 1 WHERE id = ?", (message_id,),
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE messages SET processed = 1 WHERE id = ?", (message_id,),
+            )
+
+    def claim_unprocessed_messages(self, limit: int = 100) -> list:
+        """Atomically fetch unprocessed messages and mark them as processed.
+
+        Unlike get_unprocessed_messages() followed by mark_message_processed()
+        per row, this is a single transaction, and a message can only be
+        claimed once even with several consumers. Requires SQLite 3.35+.
+
+        Args:
+            limit: Maximum number of messages to claim
+
+        Returns:
+            List of sqlite3.Row objects (id, sender, receiver, message,
+            timestamp), oldest first
+
+        """
+        with self._write() as conn:
+            rows = conn.execute(
+                """
+                UPDATE messages SET processed = 1
+                WHERE id IN (
+                    SELECT id FROM messages WHERE processed = 0 ORDER BY id LIMIT ?
                 )
-                self.db_conn.commit()
-            finally:
-                cursor.close()
+                RETURNING id, sender, receiver, message, timestamp
+                """,
+                (limit,),
+            ).fetchall()
+        rows.sort(key=lambda row: row["id"])
+        return rows
 
     def cleanup(self):
-        """Close database connection and cleanup resources."""
-        if hasattr(self, "db_conn"):
-            self.db_conn.close()
+        """Close database connection and cleanup resources.
+
+        Stops the background threads (which close their own connections),
+        writes any queued messages, truncates the WAL so the next open has
+        nothing to recover, and closes the calling thread's connection.
+        Connections of other threads that are still running are closed when
+        those threads exit. Safe to call more than once; it is also
+        registered with atexit.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.cleanup)
+        self._closing = True
+        self._pending_event.set()
+        self._flush_thread.join()
+        self._checkpoint_stop.set()
+        if self._checkpoint_thread is not None:
+            self._checkpoint_thread.join()
+        self.flush_messages()
+        if self._shared_conn is None:
+            try:
+                with self.db_lock:
+                    self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                self._log_error("Final WAL checkpoint failed: %s", e)
+        self._close_thread_conn()
+        if self._shared_conn is not None:
+            self._shared_conn.close()
 
     def get_users(self) -> list:
         """Get all users from the database.
 
+        Memberships are folded back into comma-separated groups and
+        muted_groups columns, the shape the old users table stored.
+
         Returns:
-            List of user records
+            List of sqlite3.Row objects with user_hash, groups and muted_groups
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute("SELECT * FROM users")
-                return cursor.fetchall()
-            finally:
-                cursor.close()
+        with self._reader() as conn:
+            return conn.execute(
+                """
+                SELECT u.user_hash,
+                       COALESCE(
+                           group_concat(CASE WHEN g.subscribed THEN g.group_name END, ','), ''
+                       ) AS groups,
+                       COALESCE(
+                           group_concat(CASE WHEN g.muted THEN g.group_name END, ','), ''
+                       ) AS muted_groups
+                FROM users u
+                LEFT JOIN user_groups g ON g.user_hash = u.user_hash
+                GROUP BY u.user_hash
+                """,
+            ).fetchall()
+
+    def add_user(self, user_hash: str) -> None:
+        """Register a user without any group memberships.
+
+        Args:
+            user_hash: User's unique hash
 
-    def save_user(self, user_hash: str, groups: str, muted_groups: str) -> None:
-        """Save or update a user in the database.
+        """
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_hash) VALUES (?)", (user_hash,))
+
+    def add_user_group(self, user_hash: str, group_name: str) -> None:
+        """Subscribe a user to a group, registering the user if needed.
 
         Args:
             user_hash: User's unique hash
-            groups: User's subscribed groups
-            muted_groups: User's muted groups
+            group_name: Group to subscribe to
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO users (user_hash, groups, muted_groups)
-                    VALUES (?, ?, ?)
-                    """,
-                    (user_hash, groups, muted_groups),
-                )
-                self.db_conn.commit()
-            finally:
-                cursor.close()
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_hash) VALUES (?)", (user_hash,))
+            conn.execute(
+                """
+                INSERT INTO user_groups (user_hash, group_name) VALUES (?, ?)
+                ON CONFLICT (user_hash, group_name) DO UPDATE SET subscribed = 1
+                """,
+                (user_hash, group_name),
+            )
+
+    def set_muted(self, user_hash: str, group_name: str, muted: bool) -> None:
+        """Mute or unmute a group for a user, registering the user if needed.
+
+        A group can be muted without being subscribed, as "mute ALL" does.
+        A row left neither subscribed nor muted is removed.
+
+        Args:
+            user_hash: User's unique hash
+            group_name: Group to mute or unmute
+            muted: New muted state
+
+        """
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_hash) VALUES (?)", (user_hash,))
+            conn.execute(
+                """
+                INSERT INTO user_groups (user_hash, group_name, subscribed, muted)
+                VALUES (?, ?, 0, ?)
+                ON CONFLICT (user_hash, group_name) DO UPDATE SET muted = excluded.muted
+                """,
+                (user_hash, group_name, int(muted)),
+            )
+            self._prune_user_group(conn, user_hash, group_name)
+
+    def remove_user_group(self, user_hash: str, group_name: str) -> None:
+        """Unsubscribe a user from a group, keeping it muted if it was.
+
+        Args:
+            user_hash: User's unique hash
+            group_name: Group to leave
+
+        """
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE user_groups SET subscribed = 0 WHERE user_hash = ? AND group_name = ?",
+                (user_hash, group_name),
+            )
+            self._prune_user_group(conn, user_hash, group_name)
+
+    @staticmethod
+    def _prune_user_group(conn: sqlite3.Connection, user_hash: str, group_name: str) -> None:
+        """Delete a membership row that is neither subscribed nor muted."""
+        conn.execute(
+            """
+            DELETE FROM user_groups
+            WHERE user_hash = ? AND group_name = ? AND subscribed = 0 AND muted = 0
+            """,
+            (user_hash, group_name),
+        )
 
     def remove_user(self, user_hash: str) -> None:
-        """Remove a user from the database.
+        """Remove a user and all of their group memberships from the database.
 
         Args:
             user_hash: Hash of the user to remove
 
         """
-        with self.db_lock:
-            cursor = self.db_conn.cursor()
-            try:
-                cursor.execute("DELETE FROM users WHERE user_hash = ?", (user_hash,))
-                self.db_conn.commit()
-            finally:
-                cursor.close()
+        with self._write() as conn:
+            conn.execute("DELETE FROM user_groups WHERE user_hash = ?", (user_hash,))
+            conn.execute("DELETE FROM users WHERE user_hash = ?", (user_hash,))